@@ -1,10 +1,46 @@
+import os
+import tempfile
+
 PARQUET_URL = "https://blobs.duckdb.org/nl-railway/services-2023.parquet"
 
 SVCS_CSV_FILE = "data/services-2023.csv.gz"
 SVCS_CSV_URL = "https://blobs.duckdb.org/nl-railway/services-2023.csv.gz"
+# Only the date and station name are read; the rest stay VARCHAR to skip parsing
+SVCS_CSV_COLUMNS = {
+    "Service:RDT-ID": "VARCHAR",
+    "Service:Date": "DATE",
+    "Service:Type": "VARCHAR",
+    "Service:Company": "VARCHAR",
+    "Service:Train number": "VARCHAR",
+    "Service:Completely cancelled": "VARCHAR",
+    "Service:Partly cancelled": "VARCHAR",
+    "Service:Maximum delay": "VARCHAR",
+    "Stop:RDT-ID": "VARCHAR",
+    "Stop:Station code": "VARCHAR",
+    "Stop:Station name": "VARCHAR",
+    "Stop:Arrival time": "VARCHAR",
+    "Stop:Arrival delay": "VARCHAR",
+    "Stop:Arrival cancelled": "VARCHAR",
+    "Stop:Departure time": "VARCHAR",
+    "Stop:Departure delay": "VARCHAR",
+    "Stop:Departure cancelled": "VARCHAR",
+}
 
 STAT_CSV_FILE = "data/stations-2022-01.csv"
 STAT_CSV_URL = "https://blobs.duckdb.org/data/stations-2022-01.csv"
+STAT_CSV_COLUMNS = {
+    "id": "BIGINT",
+    "code": "VARCHAR",
+    "uic": "BIGINT",
+    "name_short": "VARCHAR",
+    "name_medium": "VARCHAR",
+    "name_long": "VARCHAR",
+    "slug": "VARCHAR",
+    "country": "VARCHAR",
+    "type": "VARCHAR",
+    "geo_lat": "DOUBLE",
+    "geo_lng": "DOUBLE",
+}
 
 DIST_CSV_FILE = "data/tariff-distances-2022-01.csv"
 DIST_CSV_URL = "https://blobs.duckdb.org/data/tariff-distances-2022-01.csv"
@@ -14,3 +50,15 @@ SVCS_BY_MONTH_TBL_NAME = "services_per_month"
 STAT_TBL_NAME = "stations"
 DIST_TBL_NAME = "distances"
 DIST_LNG_TBL_NAME = "distances_long"
+
+CONNECTION_CONFIG = {
+    "temp_directory": os.path.join(tempfile.gettempdir(), "duckdb"),
+    "enable_object_cache": True,
+    "preserve_insertion_order": False,
+}
+
+REMOTE_SETTINGS = {
+    "enable_external_file_cache": True,
+    "http_keep_alive": True,
+    "http_retries": 5,
+}
@@ -1,17 +1,24 @@
+import calendar
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal
 
 import duckdb
+import pyarrow as pa
 from config import (
+    CONNECTION_CONFIG,
     DIST_CSV_FILE,
     DIST_CSV_URL,
     DIST_LNG_TBL_NAME,
     DIST_TBL_NAME,
+    PARQUET_URL,
+    REMOTE_SETTINGS,
+    STAT_CSV_COLUMNS,
     STAT_CSV_FILE,
     STAT_CSV_URL,
     STAT_TBL_NAME,
     SVCS_BY_MONTH_TBL_NAME,
+    SVCS_CSV_COLUMNS,
     SVCS_CSV_FILE,
-    SVCS_CSV_URL,
     SVCS_TBL_NAME,
 )
 from errors import ErrNoResults
@@ -25,16 +32,30 @@ console = Console()
 class Analyzer:
     def __init__(self, mode: Literal["remote", "local"] = "remote") -> None:
         self.mode = mode
-        self.con = duckdb.connect(":memory:")
+        self.con = duckdb.connect(":memory:", config=CONNECTION_CONFIG)
 
-        self.services_file = SVCS_CSV_FILE if mode == "local" else SVCS_CSV_URL
+        if mode == "remote":
+            self.configure_remote()
+
+        self.services_file = SVCS_CSV_FILE if mode == "local" else PARQUET_URL
         self.stations_file = STAT_CSV_FILE if mode == "local" else STAT_CSV_URL
         self.distances_file = DIST_CSV_FILE if mode == "local" else DIST_CSV_URL
 
-        self.files = {
-            "services": self.services_file,
-            "stations": self.stations_file,
-            "distances": self.distances_file,
+        services_reader = (
+            f"""read_csv(
+                {self.services_file!r},
+                auto_detect = false,
+                header = true,
+                columns = {SVCS_CSV_COLUMNS}
+            )"""
+            if mode == "local"
+            else f"read_parquet({self.services_file!r})"
+        )
+
+        self.tables = {
+            "services": SVCS_TBL_NAME,
+            "stations": STAT_TBL_NAME,
+            "distances": DIST_TBL_NAME,
         }
 
         self.subqueries = {
@@ -43,66 +64,109 @@ class Analyzer:
                 month("Service:Date") AS month,
                 "Stop:station name" AS station,
                 count(*) AS num_services
-            FROM {self.services_file!r}
-            GROUP BY ALL
+            FROM {SVCS_TBL_NAME}
+            GROUP BY month("Service:Date"), "Stop:station name"
             """,
             DIST_LNG_TBL_NAME: f"""
-            UNPIVOT {DIST_TBL_NAME}
-            ON COLUMNS (* EXCLUDE station)
-            INTO NAME other_station VALUE distance
+            SELECT station, other_station, distance
+            FROM (
+                UNPIVOT {DIST_TBL_NAME}
+                ON COLUMNS (* EXCLUDE station)
+                INTO NAME other_station VALUE distance
+            )
+            WHERE station < other_station
+            """,
+            SVCS_TBL_NAME: f"""
+            SELECT "Service:Date", "Stop:station name"
+            FROM {services_reader}
+            """,
+            STAT_TBL_NAME: f"""
+            FROM read_csv(
+                {self.stations_file!r},
+                auto_detect = false,
+                header = true,
+                columns = {STAT_CSV_COLUMNS}
+            )
             """,
-            SVCS_TBL_NAME: f"FROM {self.services_file!r}",
-            STAT_TBL_NAME: f"FROM {self.stations_file!r}",
             DIST_TBL_NAME: f"FROM read_csv({self.distances_file!r}, nullstr='XXX')",
         }
 
-        if mode == "local":
-            self.load_local_data()
+        self.load_data()
+
+        self.prepared: set[str] = set()
+        self.counts: dict[str, int] = {}
 
-    @property
-    def is_remote(self) -> bool:
-        return self.mode == "remote"
+    def configure_remote(self):
+        self.con.execute("INSTALL httpfs; LOAD httpfs;")
 
-    def create_tbl(self, tbl: str):
+        # Older DuckDB releases don't know about every setting (e.g. the
+        # external file cache landed in 1.3), so only apply what's supported.
+        supported = {
+            row[0]
+            for row in self.con.execute("SELECT name FROM duckdb_settings()").fetchall()
+        }
+        for name, value in REMOTE_SETTINGS.items():
+            if name in supported:
+                self.con.execute(f"SET GLOBAL {name} = {value}")
+
+    def create_tbl(self, tbl: str, con: duckdb.DuckDBPyConnection | None = None):
         subqry = self.subqueries.get(tbl)
         if not subqry:
             raise Exception(f"No subquery defined for {tbl}")
 
-        self.con.execute(f"""
+        (con or self.con).execute(f"""
         CREATE TABLE {tbl} AS ({subqry})
         """)
 
-    def load_local_data(self):
-        self.create_tbl(SVCS_TBL_NAME)
-        self.create_tbl(SVCS_BY_MONTH_TBL_NAME)
-        self.create_tbl(STAT_TBL_NAME)
-        self.create_tbl(DIST_TBL_NAME)
-        self.create_tbl(DIST_LNG_TBL_NAME)
-
-    def add_cte(self, qry: str, tbl: str) -> str:
-        subqry = self.subqueries.get(tbl)
-        if not subqry:
-            raise Exception(f"No subquery defined for {tbl}")
+    def create_tbl_on_cursor(self, tbl: str):
+        with self.con.cursor() as cur:
+            self.create_tbl(tbl, cur)
+
+    def create_tbls(self, tbls: list[str]):
+        """Create `tbls` concurrently, each on its own cursor of `self.con`."""
+        with ThreadPoolExecutor(max_workers=len(tbls)) as pool:
+            futures = [pool.submit(self.create_tbl_on_cursor, tbl) for tbl in tbls]
+            for future in futures:
+                future.result()
+
+    def load_data(self):
+        # Source tables are independent fetches; derived ones need them first.
+        self.create_tbls([SVCS_TBL_NAME, STAT_TBL_NAME, DIST_TBL_NAME])
+        self.create_tbls([SVCS_BY_MONTH_TBL_NAME, DIST_LNG_TBL_NAME])
+
+    def execute_prepared(
+        self, name: str, qry: str, params: list[int], batch_size: int = 1024
+    ) -> pa.RecordBatchReader:
+        """Run `qry` as the prepared statement `name`, preparing it on first use."""
+        if name not in self.prepared:
+            self.con.execute(f"PREPARE {name} AS {qry}")
+            self.prepared.add(name)
+
+        # EXECUTE only accepts constant arguments, not bound parameters
+        args = ", ".join(str(int(param)) for param in params)
+        return self.con.execute(f"EXECUTE {name}({args})").fetch_record_batch(
+            batch_size
+        )
 
-        return f"""
-        WITH {tbl} AS ({subqry})
-        {qry}
-        """
+    def get_tbl_counts(self) -> dict[str, int]:
+        # Tables are loaded once and never modified, so counts are fixed
+        if self.counts:
+            return self.counts
 
-    def get_tbl_count(self, tbl_name: str) -> str:
-        result = self.con.execute(
-            f"SELECT format('{{:,}}', count(*)) FROM {tbl_name!r};"
-        ).fetchone()
+        counts = ", ".join(
+            f"(SELECT count(*) FROM {tbl})" for tbl in self.tables.values()
+        )
+        result = self.con.execute(f"SELECT {counts};").fetchone()
 
         if not result:
             raise ErrNoResults()
 
-        return result[0]
+        self.counts = dict(zip(self.tables, result))
+        return self.counts
 
     def show_count(self):
-        for file_name, file in self.files.items():
-            result = self.get_tbl_count(file)
-            print(f"Total {file_name.capitalize()} Rows: {result}")
+        for name, result in self.get_tbl_counts().items():
+            print(f"Total {name.capitalize()} Rows: {result:,}")
 
     def get_busiest_by_month(self, month_cutoff: int = 6) -> Table:
         qry = f"""
@@ -112,65 +176,57 @@ class Analyzer:
             max(num_services) AS num_services
         FROM {SVCS_BY_MONTH_TBL_NAME}
         WHERE month <= $1
-        GROUP BY ALL;
+        GROUP BY month
+        ORDER BY month;
         """
 
-        if self.is_remote:
-            qry = self.add_cte(qry, SVCS_BY_MONTH_TBL_NAME)
-
-        result = self.con.execute(qry, [month_cutoff]).fetchall()
-
-        if not result:
-            raise ErrNoResults()
-
-        return (
+        batches = self.execute_prepared("busiest_by_month", qry, [month_cutoff])
+        maker = (
             TableMaker(title="Busiest Station by Month")
             .with_column("month")
             .with_column("station")
             .with_column("num_services")
-            .with_rows(result)
-            .build()
+            .with_record_batches(batches)
         )
 
+        if not maker.rows:
+            raise ErrNoResults()
+
+        return maker.build()
+
     def get_top_n_stations_in_period(
         self, n: int = 3, start: int = 1, end: int = 12
     ) -> Table:
         """Get the top `n` stations in the months between `start` and `end`."""
+        # A list slice with n < 1 would return every station, not none
+        if n < 1:
+            raise ErrNoResults()
+
         qry = f"""
-        SELECT month, month_name, array_agg(station) AS top_stations
-        FROM (
-            SELECT
-                month,
-                strftime(make_date(2023, month, 1), '%B') AS month_name,
-                rank() OVER
-                    (PARTITION BY month ORDER BY num_services DESC) AS rank,
-                station,
-                num_services
-            FROM {SVCS_BY_MONTH_TBL_NAME}
-            WHERE month BETWEEN $1 AND $2
-        )
-        WHERE rank <= $3
-        GROUP BY ALL
+        SELECT
+            month,
+            month AS month_name,
+            list(station ORDER BY num_services DESC)[1:$3] AS top_stations
+        FROM {SVCS_BY_MONTH_TBL_NAME}
+        WHERE month BETWEEN $1 AND $2
+        GROUP BY month
         ORDER BY month;
         """
 
-        if self.is_remote:
-            qry = self.add_cte(qry, SVCS_BY_MONTH_TBL_NAME)
-
-        result = self.con.execute(qry, [start, end, n]).fetchall()
-
-        if not result:
-            raise ErrNoResults()
-
-        return (
+        batches = self.execute_prepared("top_n_stations", qry, [start, end, n])
+        maker = (
             TableMaker(title=f"Top {n} Stations in Months {start}-{end}")
             .with_column("month")
-            .with_column("month_name")
+            .with_column("month_name", lambda month: calendar.month_name[month])
             .with_column("top_stations")
-            .with_rows(result)
-            .build()
+            .with_record_batches(batches)
         )
 
+        if not maker.rows:
+            raise ErrNoResults()
+
+        return maker.build()
+
     def get_stations(self, limit: int = 5) -> Table:
         qry = f"""
         SELECT
@@ -178,91 +234,88 @@ class Analyzer:
             name_short,
             name_long,
             country,
-            printf('%.2f', geo_lat) AS latitude,
-            printf('%.2f', geo_lng) AS longitude
+            geo_lat AS latitude,
+            geo_lng AS longitude
         FROM {STAT_TBL_NAME}
+        ORDER BY id
         LIMIT $1
         """
 
-        if self.is_remote:
-            qry = self.add_cte(qry, STAT_TBL_NAME)
-
-        result = self.con.execute(qry, [limit]).fetchall()
-
-        if not result:
-            raise ErrNoResults()
-
-        return (
+        batches = self.execute_prepared("stations", qry, [limit])
+        maker = (
             TableMaker(title="Stations")
             .with_column("id")
             .with_column("name_short")
             .with_column("name_long")
             .with_column("country")
-            .with_column("latitude")
-            .with_column("longitude")
-            .with_rows(result)
-            .build()
+            .with_column("latitude", lambda lat: f"{lat:.2f}")
+            .with_column("longitude", lambda lng: f"{lng:.2f}")
+            .with_record_batches(batches)
         )
 
+        if not maker.rows:
+            raise ErrNoResults()
+
+        return maker.build()
+
     def get_distances(self, limit: int = 5) -> Table:
         qry = f"""
         SELECT station, other_station, distance
         FROM {DIST_LNG_TBL_NAME}
+        ORDER BY station, other_station
         LIMIT $1
         """
 
-        if self.is_remote:
-            qry = self.add_cte(qry, DIST_LNG_TBL_NAME)
-
-        result = self.con.execute(qry, [limit]).fetchall()
-        if not result:
-            raise ErrNoResults()
-
-        return (
+        batches = self.execute_prepared("distances", qry, [limit])
+        maker = (
             TableMaker(title="Station Pair Distances")
             .with_column("station")
             .with_column("other_station")
             .with_column("distance")
-            .with_rows(result)
-            .build()
+            .with_record_batches(batches)
         )
 
+        if not maker.rows:
+            raise ErrNoResults()
+
+        return maker.build()
+
     def get_station_pairs(
         self, order: Literal["ASC", "DESC"] = "DESC", limit: int = 3
     ) -> Table:
         qry = f"""
+        WITH nl AS (
+            SELECT code, name_long
+            FROM {STAT_TBL_NAME}
+            WHERE country = 'NL'
+        )
         SELECT
             s1.name_long AS station1,
             s2.name_long AS station2,
             {DIST_LNG_TBL_NAME}.distance
         FROM {DIST_LNG_TBL_NAME}
-        JOIN
-            {STAT_TBL_NAME} s1 ON {DIST_LNG_TBL_NAME}.station = s1.code
-        JOIN
-            {STAT_TBL_NAME} s2 ON {DIST_LNG_TBL_NAME}.other_station = s2.code
-        WHERE
-            s1.country = 'NL'
-            AND s2.country = 'NL'
-            AND station < other_station
+        JOIN nl s1 ON {DIST_LNG_TBL_NAME}.station = s1.code
+        JOIN nl s2 ON {DIST_LNG_TBL_NAME}.other_station = s2.code
         ORDER BY distance {order}
         LIMIT $1
         """
 
-        result = self.con.execute(qry, [limit]).fetchall()
-        if not result:
-            raise ErrNoResults()
-
-        return (
+        batches = self.execute_prepared(f"station_pairs_{order.lower()}", qry, [limit])
+        maker = (
             TableMaker(
                 title=f"{'Furthest' if order == 'DESC' else 'Shortest'} Station Distances"
             )
             .with_column("station1")
             .with_column("station2")
             .with_column("distance")
-            .with_rows(result)
-            .build()
+            .with_record_batches(batches)
         )
 
+        if not maker.rows:
+            raise ErrNoResults()
+
+        return maker.build()
+
     def analyze(self):
         self.show_count()
 
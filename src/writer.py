@@ -1,17 +1,31 @@
-from typing import Self
+from typing import Any, Callable, Self
 
+import pyarrow as pa
+import pyarrow.compute as pc
 from rich.table import Table
 
 
+def format_value(fmt: Callable[[Any], str] | None, data: Any) -> str:
+    # Nulls render as "None" regardless of the column's formatter
+    if fmt is None or data is None:
+        return str(data)
+
+    return fmt(data)
+
+
 class TableMaker:
     def __init__(self, title: str) -> None:
         self.table = Table(title=title)
 
         self.cols = []
+        self.formatters = []
         self.rows = []
 
-    def with_column(self, name: str) -> Self:
+    def with_column(
+        self, name: str, formatter: Callable[[Any], str] | None = None
+    ) -> Self:
         self.cols.append((name,))
+        self.formatters.append(formatter)
         return self
 
     def with_rows(self, rows: list[tuple]) -> Self:
@@ -21,7 +35,37 @@ class TableMaker:
                     f"Mismatched column count: got {len(row)}, expected {len(self.cols)}"
                 )
 
-            self.rows.append((str(data) for data in row))
+            self.rows.append(
+                tuple(
+                    format_value(fmt, data) for fmt, data in zip(self.formatters, row)
+                )
+            )
+
+        return self
+
+    def with_arrow(self, tbl: pa.Table | pa.RecordBatch) -> Self:
+        if tbl.num_columns != len(self.cols):
+            raise Exception(
+                f"Mismatched column count: got {tbl.num_columns}, expected {len(self.cols)}"
+            )
+
+        cols = []
+        for fmt, col in zip(self.formatters, tbl.columns):
+            if fmt:
+                cols.append([format_value(fmt, data) for data in col.to_pylist()])
+            # Arrow can't cast nested types (e.g. lists) to strings
+            elif pa.types.is_nested(col.type):
+                cols.append([str(data) for data in col.to_pylist()])
+            else:
+                cols.append(pc.fill_null(pc.cast(col, pa.string()), "None").to_pylist())
+
+        self.rows.extend(zip(*cols))
+
+        return self
+
+    def with_record_batches(self, reader: pa.RecordBatchReader) -> Self:
+        for batch in reader:
+            self.with_arrow(batch)
 
         return self
 